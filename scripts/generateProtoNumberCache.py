@@ -18,31 +18,37 @@ You should have received a copy of the GNU Affero General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
-import requests, json, os
+import json, os
 from wikiMiner import *
-from bs4 import BeautifulSoup
+import lxml.html
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 
 def main():
-    sp = BeautifulSoup(
-        requests.get(
-            "https://minecraft.wiki/api.php?action=parse&page=Minecraft_Wiki:Projects/wiki.vg_merge/Protocol_version_numbers&format=json"
-        ).json()["parse"]["text"]["*"]
+    resp = SESSION.get(
+        "https://minecraft.wiki/api.php?action=parse&page=Minecraft_Wiki:Projects/wiki.vg_merge/Protocol_version_numbers&format=json"
     )
+    jso = orjson.loads(resp.content) if orjson is not None else resp.json()
+
+    root = lxml.html.fromstring(jso["parse"]["text"]["*"])
 
-    table = sp.find("table").find("tbody")
+    table = root.xpath("(//table)[1]/tbody")[0]
     rowspan_mode = None
 
     out = []
 
 
-    for row in table.find_all("tr"):
-        cells = row.find_all("td")
+    for row in table.xpath("./tr"):
+        cells = row.xpath("./td")
         if len(cells) == 0:
             continue
 
-        if len(cells) == 3 and rowspan_mode is None and "rowspan" in cells[1].attrs:
-            rowspan_mode = [int(cells[1]["rowspan"]),  cells[1], cells[2]]
+        if len(cells) == 3 and rowspan_mode is None and "rowspan" in cells[1].attrib:
+            rowspan_mode = [int(cells[1].get("rowspan")),  cells[1], cells[2]]
 
         if rowspan_mode:
             cells = (cells[0], rowspan_mode[1], rowspan_mode[2])
@@ -51,19 +57,22 @@ def main():
                 rowspan_mode = None
         
 
-        if len(cells) == 3 and (a:=cells[2].find("a")) is not None:
-            if a.text != "page":
+        if len(cells) == 3 and (a:=cells[2].xpath("(.//a)[1]")):
+            if a[0].text_content() != "page":
                 continue
             
-            out.append((cells[0].text.strip(), cells[1].text.strip(), a.get('href')))
+            out.append((cells[0].text_content().strip(), cells[1].text_content().strip(), a[0].get('href')))
+
 
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../data/protoNums.json")
 
-    f = open(
-        os.path.join(os.path.dirname(os.path.abspath(__file__)), "../data/protoNums.json")
-        , "w")
-    
-    f.write(json.dumps(out, indent=2))
-    f.close()
+    # Write straight from the serializer, without an extra decoded copy of the document
+    if orjson is not None:
+        with open(path, "wb") as f:
+            f.write(orjson.dumps(out, option=orjson.OPT_INDENT_2))
+    else:
+        with open(path, "w") as f:
+            json.dump(out, f, indent=2)
 
 
     print("Saved results to protoNums.json")
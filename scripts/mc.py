@@ -22,14 +22,23 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 import os, sys, json
 import gzip
-import platform
 import subprocess
+import time
 import re
-from urllib3 import request
+import shutil
+import urllib3
 import xml.etree.ElementTree as ET
 
 
 import hashlib
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from storage import get_storage_dir, STORAGE_DIR
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 MIN_JAVA_VERSION = 16
 CFR_URL = "https://www.benf.org/other/cfr/cfr-0.152.jar"
@@ -42,29 +51,45 @@ VERSION_MANIFEST_URL = "https://piston-meta.mojang.com/mc/game/version_manifest.
 YARN_FABRIC_BASE = "https://maven.fabricmc.net/net/fabricmc/yarn/"
 YARN_LEGACY_BASE = "https://repo.legacyfabric.net/legacyfabric/net/legacyfabric/yarn/"
 
+# Shared by every request so connections to each host are reused, and
+# transient server errors are retried
+HTTP = urllib3.PoolManager(
+    maxsize=8,
+    retries=urllib3.util.Retry(total=3, backoff_factor=0.5, status_forcelist=(500, 502, 503, 504),
+                               raise_on_status=False),
+)
 
 
-def get_storage_dir() -> str:
-    os_name = platform.system()
 
-    # Highest priority: explicit override
-    if "GRYLA_HOME" in os.environ:
-        return os.path.expanduser(os.environ["GRYLA_HOME"])
+# The json caches are only ever read by this script, so they are
+# written compactly and read back in one go
+def read_json_cache(path : str):
+    with open(path, "rb") as f:
+        data = f.read()
+    return orjson.loads(data) if orjson is not None else json.loads(data)
 
-    if os_name == "Linux":
-        base = os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
-        return os.path.join(base, "gryla")
+def write_json_cache(path : str, obj):
+    if orjson is not None:
+        data = orjson.dumps(obj)
+    else:
+        data = json.dumps(obj, separators=(",", ":")).encode()
+    with open(path, "wb") as f:
+        f.write(data)
 
-    if os_name == "Darwin":  # macOS
-        return os.path.expanduser("~/Library/Caches/gryla")
+def _parse_java_major_version(version : str) -> int:
+    # Find something like "21.0.1" or "1.8.0_371"
+    m = re.search(r'(\d+)(?:\.(\d+))?', version)
+    if not m:
+        raise RuntimeError("Could not parse Java version from: " + version)
 
-    if os_name == "Windows":
-        local_appdata = os.environ.get("LOCALAPPDATA")
-        if local_appdata is not None:
-            return os.path.join(local_appdata, "gryla", "Cache")
+    major = int(m.group(1))
+    minor = m.group(2)
 
-    # Fallback if unknown system
-    raise RuntimeError(f"Cannot determine cache directory on {os_name}")
+    # Handle the legacy "1.x" versions (Java <= 8)
+    if major == 1 and minor is not None:
+        major = int(minor)
+
+    return major
 
 def get_java_major_version():
     try:
@@ -78,23 +103,45 @@ def get_java_major_version():
     except FileNotFoundError:
         raise RuntimeError("Java not installed or not in PATH")
 
-    first_line = result.stdout.splitlines()[0].strip()
-
-    # Find something like "21.0.1" or "1.8.0_371"
-    m = re.search(r'(\d+)(?:\.(\d+))?', first_line)
-    if not m:
-        raise RuntimeError("Could not parse Java version from: " + first_line)
+    return _parse_java_major_version(result.stdout.splitlines()[0].strip())
+
+def _get_java_home_major_version(java_exe : str) -> int | None:
+    # Only trust JAVA_HOME if it is where the java on the PATH lives
+    java_home = os.environ.get("JAVA_HOME")
+    if java_home is None:
+        return None
+    java_home = os.path.realpath(java_home)
+    release = os.path.join(java_home, "release")
+    if not java_exe.startswith(java_home + os.sep) or not os.path.exists(release):
+        return None
+
+    with open(release, "r") as f:
+        m = re.search(r'^JAVA_VERSION="([^"]+)"', f.read(), re.M)
+    return _parse_java_major_version(m.group(1)) if m else None
+
+def get_java_major_version_cached():
+    # Starting a JVM just to ask its version is slow, so only do it
+    # when the java executable has changed since it was last asked
+    java = shutil.which("java")
+    if java is None:
+        raise RuntimeError("Java not installed or not in PATH")
+    java = os.path.realpath(java)
 
-    major = int(m.group(1))
-    minor = m.group(2)
+    if (major := _get_java_home_major_version(java)) is not None:
+        return major
 
-    # Handle the legacy "1.x" versions (Java <= 8)
-    if major == 1 and minor is not None:
-        major = int(minor)
+    mtime = os.path.getmtime(java)
+    if os.path.exists(JAVA_VERSION_CACHE):
+        cached = read_json_cache(JAVA_VERSION_CACHE)
+        if cached["path"] == java and cached["mtime"] == mtime:
+            return cached["major"]
 
+    major = get_java_major_version()
+    write_json_cache(JAVA_VERSION_CACHE, {"path": java, "mtime": mtime, "major": major})
     return major
+
 def verify_java() -> bool:
-    return get_java_major_version() > MIN_JAVA_VERSION
+    return get_java_major_version_cached() > MIN_JAVA_VERSION
 
 def sizeof_fmt(num, suffix="B"):
     # http://stackoverflow.com/questions/1094841/ddg#1094933
@@ -104,8 +151,10 @@ def sizeof_fmt(num, suffix="B"):
         num /= 1024.0
     return f"{num:.1f}Yi{suffix}"
 
-def download_file(url : str, outpath : str, output=True):
-    resp = request("GET", url, preload_content=False, decode_content=False)
+# If a hashlib object is passed as hasher, it is fed every chunk as it
+# arrives, so the file never has to be read back to verify it
+def download_file(url : str, outpath : str, output=True, hasher=None):
+    resp = HTTP.request("GET", url, preload_content=False, decode_content=False)
     if resp.status != 200:
         raise ConnectionError(f"ERROR: cannot fetch {url}")
 
@@ -121,26 +170,26 @@ def download_file(url : str, outpath : str, output=True):
         sys.stdout.write(last_write := "0" + ending)
 
     cnt = 0
+    # Redrawing the progress line on every chunk costs more than the
+    # download itself on a fast link, so limit it to ~10 times a second
+    next_tick = time.monotonic() + 0.1
 
     with open(outpath, "wb") as f:
-        for chunk in resp.stream():
+        for chunk in resp.stream(1 << 20):
             cnt += len(chunk)
-            if output:
-                s = "\r" + sizeof_fmt(cnt) + ending
-                if len(last_write) > len(s):
-                    s += " " * (len(last_write) - len(s))
+            if output and time.monotonic() >= next_tick:
+                next_tick = time.monotonic() + 0.1
+                s = sizeof_fmt(cnt) + ending
+                sys.stdout.write("\r" + s.ljust(len(last_write)))
                 last_write = s
-                sys.stdout.write(s)
+            if hasher is not None:
+                hasher.update(chunk)
             f.write(chunk)
     if output:
-        s = "\rDownload completed!"
-        if len(last_write) > len(s):
-            s += " " * (len(last_write) - len(s))
-        sys.stdout.write(s + "\n")
+        sys.stdout.write("\r" + "Download completed!".ljust(len(last_write)) + "\n")
     resp.close()
         
 
-STORAGE_DIR = get_storage_dir()
 os.makedirs(STORAGE_DIR, exist_ok=True)
 
 CFR = os.path.join(STORAGE_DIR, "cfr.jar")
@@ -152,12 +201,57 @@ LEGACY_YARN_CACHE = os.path.join(STORAGE_DIR, "lagacy_yarn.json")
 
 VERSION_MANIFEST_CACHE = os.path.join(STORAGE_DIR, "version_manifest.json")
 
-def _get_yarn_versions(url : str):
-    resp = request("GET", url)
-    root = ET.fromstring(resp.data)
-    versions = root[2][2]
+JAVA_VERSION_CACHE = os.path.join(STORAGE_DIR, "java_version.json")
+
+# {jar name: {"sha1": digest, "mtime": mtime}} for the tool jars
+TOOLS_SHA1_CACHE = os.path.join(STORAGE_DIR, "tools.sha1.json")
+
+TOOLS = (
+    ("cfr", CFR_URL, CFR),
+    ("tiny remapper", REMAPPER_URL, REMAPPER),
+    ("mapping io", MAPPINGIO_URL, MAPPINGIO),
+)
+
+# How many of the first run downloads may happen at once
+BOOTSTRAP_WORKERS = 6
+
+def download_tool(url : str, path : str) -> str:
+    # Download to a temporary name so an interrupted download never
+    # looks like an installed tool, returns the sha1 of the jar
+    hobj = hashlib.sha1()
+    download_file(url, path + ".part", output=False, hasher=hobj)
+    os.replace(path + ".part", path)
+    return hobj.hexdigest()
+
+def check_tool(path : str, digests : dict) -> bool:
+    # Rehashing every jar on every run would be slow, so a jar is only
+    # rehashed when it has changed since its digest was recorded.
+    # Returns False if the jar is missing or corrupt, and records
+    # digests for jars that do not have one yet
+    if not os.path.exists(path):
+        return False
+    name = os.path.basename(path)
+    mtime = os.path.getmtime(path)
+    record = digests.get(name)
+    if record is not None and record["mtime"] == mtime:
+        return True
+
+    with open(path, "rb") as f:
+        digest = hashlib.file_digest(f, "sha1").hexdigest()
+    if record is not None and record["sha1"] != digest:
+        return False
+    digests[name] = {"sha1": digest, "mtime": mtime}
+    return True
 
-    return [v.text for v in versions]
+def _get_yarn_versions(url : str):
+    # Parse the metadata as it downloads, and stop as soon as the
+    # <versions> list has been read, rather than building the whole tree
+    resp = HTTP.request("GET", url, preload_content=False)
+    with resp:
+        for _, elem in ET.iterparse(resp):
+            if elem.tag == "versions":
+                return [v.text for v in elem]
+    raise ValueError(f"ERROR: no versions listed in {url}")
 
 
 def get_modern_yarn_versions_web():
@@ -167,42 +261,41 @@ def get_legacy_yarn_versions_web():
     return _get_yarn_versions(YARN_LEGACY_BASE + "maven-metadata.xml")
 
 
+# The *_cached getters are also memoized for the life of the process,
+# clear_cache resets them along with the files on disk
+@functools.lru_cache(maxsize=1)
 def get_modern_yarn_versions_cached():
     if os.path.exists(MODERN_YARN_CACHE):
-        with open(MODERN_YARN_CACHE, "r") as f:
-            return json.load(f)
+        return read_json_cache(MODERN_YARN_CACHE)
 
     vers = get_modern_yarn_versions_web()
-    with open(MODERN_YARN_CACHE, "w") as f:
-        json.dump(vers, f, indent=1)
+    write_json_cache(MODERN_YARN_CACHE, vers)
     return vers
 
+@functools.lru_cache(maxsize=1)
 def get_legacy_yarn_versions_cached():
     if os.path.exists(LEGACY_YARN_CACHE):
-        with open(LEGACY_YARN_CACHE, "r") as f:
-            return json.load(f)
+        return read_json_cache(LEGACY_YARN_CACHE)
 
     vers = get_legacy_yarn_versions_web()
-    with open(LEGACY_YARN_CACHE, "w") as f:
-        json.dump(vers, f, indent=1)
+    write_json_cache(LEGACY_YARN_CACHE, vers)
     return vers
 
+@functools.lru_cache(maxsize=1)
 def get_manifest_cache():
     assert os.path.exists(VERSION_MANIFEST_CACHE)
-    with open(VERSION_MANIFEST_CACHE, "r") as f:
-        return json.load(f)
+    return read_json_cache(VERSION_MANIFEST_CACHE)
+
+@functools.lru_cache(maxsize=None)
+def get_manifest_index():
+    return {v["id"]: v for v in get_manifest_cache()["versions"]}
 
 def download_jar(versions_id : str, target : str, output : str | None):
-    vers = get_manifest_cache()["versions"]
-    version = None
-    for v in vers:
-        if v["id"] == versions_id:
-            version = v
-            break
+    version = get_manifest_index().get(versions_id)
     if version is None:
         print(f"Unknown version: {versions_id}")
         exit(1)
-    resp = request("GET", version["url"])
+    resp = HTTP.request("GET", version["url"])
     assert resp.status == 200, "Mojang server error"
 
     target = target
@@ -218,14 +311,11 @@ def download_jar(versions_id : str, target : str, output : str | None):
 
     print(f"Downloading {output}")
 
-    download_file(download_json["url"], output)
+    hobj = hashlib.sha1()
+    download_file(download_json["url"], output, hasher=hobj)
 
     print("Verifying")
 
-    hobj = hashlib.new("sha1")
-    with open(output, "rb") as f:
-        while len(b := f.read(2**16)):
-            hobj.update(b)
     digest = hobj.hexdigest()
     if digest != download_json["sha1"]:
         print("ERROR: Unable to verify file! Digests do not match")
@@ -235,13 +325,14 @@ def download_jar(versions_id : str, target : str, output : str | None):
         print("Verified!")
 
 def _get_most_recent_yarn(version_id : str):
-    modern = sorted([v for v in get_modern_yarn_versions_cached() if v.startswith(version_id + "+build")], key=lambda x: x.split(".")[-1].zfill(3))
-    if len(modern):
-        ver = modern[-1] 
+    prefix = version_id + "+build"
+    build_number = lambda v: int(v.rsplit(".", 1)[-1])
+
+    ver = max((v for v in get_modern_yarn_versions_cached() if v.startswith(prefix)), key=build_number, default=None)
+    if ver is not None:
         return f"{YARN_FABRIC_BASE}{ver}/yarn-{ver}-tiny.gz"
-    legacy = sorted([v for v in get_legacy_yarn_versions_cached() if v.startswith(version_id + "+build")], key=lambda x: x.split(".")[-1].zfill(3))
-    if len(legacy):
-        ver = legacy[-1] 
+    ver = max((v for v in get_legacy_yarn_versions_cached() if v.startswith(prefix)), key=build_number, default=None)
+    if ver is not None:
         return f"{YARN_LEGACY_BASE}{ver}/yarn-{ver}-tiny.gz"
     print(f"ERROR: unable to get yarn for version {version_id}")
     exit(1)
@@ -251,9 +342,14 @@ def get_yarn_tiny(version_id : str):
     if os.path.exists(output):
         return output
 
-    resp = request("GET", _get_most_recent_yarn(version_id), decode_content=False)
-    with open(output, "wb") as f:
-        f.write(gzip.decompress(resp.data))
+    # Decompress while downloading rather than holding both the
+    # compressed and decompressed mappings in memory. The partial file
+    # is only renamed into place once it is complete, so a failed
+    # download is never mistaken for a cached one
+    resp = HTTP.request("GET", _get_most_recent_yarn(version_id), preload_content=False, decode_content=False)
+    with resp, open(output + ".part", "wb") as f:
+        shutil.copyfileobj(gzip.GzipFile(fileobj=resp), f, 1 << 20)
+    os.replace(output + ".part", output)
     return output
 
     
@@ -314,30 +410,54 @@ def main():
     if not verify_java():
         print(f"Error: please install java {MIN_JAVA_VERSION} or later!")
         exit(1)
-    if not os.path.exists(CFR):
-        print("Downloading cfr!")
-        download_file(CFR_URL, CFR)
-    if not os.path.exists(REMAPPER):
-        print("Downloader tiny remapper!")
-        download_file(REMAPPER_URL, REMAPPER)
-
-    if not os.path.exists(MAPPINGIO):
-        print("Downloader mapping io!")
-        download_file(MAPPINGIO_URL, MAPPINGIO)
-
-    if not os.path.exists(MODERN_YARN_CACHE):
-        print("Building yarn cache")
-        _ = get_modern_yarn_versions_cached()
-        _ = get_legacy_yarn_versions_cached()
-
-    if not os.path.exists(VERSION_MANIFEST_CACHE):
-        print("Downloading minecraft version manifest")
-        download_file(VERSION_MANIFEST_URL, VERSION_MANIFEST_CACHE)
+    # None of these depend on each other, so fetch them all at once rather
+    # than waiting on each round trip in turn. Progress output is disabled
+    # as the bars of concurrent downloads would overwrite each other.
+    digests = read_json_cache(TOOLS_SHA1_CACHE) if os.path.exists(TOOLS_SHA1_CACHE) else {}
+    known_digests = dict(digests)
+
+    with ThreadPoolExecutor(max_workers=BOOTSTRAP_WORKERS) as ex:
+        jobs = []
+        tool_jobs = []
+        for name, url, path in TOOLS:
+            if not check_tool(path, digests):
+                if os.path.exists(path):
+                    print(f"The {name} jar is corrupt, replacing it")
+                print(f"Downloading {name}!")
+                tool_jobs.append((path, ex.submit(download_tool, url, path)))
+                jobs.append(tool_jobs[-1][1])
+        if not os.path.exists(VERSION_MANIFEST_CACHE):
+            print("Downloading minecraft version manifest!")
+            jobs.append(ex.submit(download_file, VERSION_MANIFEST_URL, VERSION_MANIFEST_CACHE, output=False))
+
+        if not os.path.exists(MODERN_YARN_CACHE):
+            print("Building yarn cache")
+            jobs.append(ex.submit(get_modern_yarn_versions_cached))
+            jobs.append(ex.submit(get_legacy_yarn_versions_cached))
+
+        for job in jobs:
+            job.result()
+
+        for path, job in tool_jobs:
+            digests[os.path.basename(path)] = {"sha1": job.result(), "mtime": os.path.getmtime(path)}
+
+    if digests != known_digests:
+        write_json_cache(TOOLS_SHA1_CACHE, digests)
+
+    if len(jobs):
+        print("Download completed!")
 
     if sys.argv[1] in ["cache", "clear_cache"]:
         for p in os.listdir(STORAGE_DIR):
             print(f"Removing {p}")
-            os.remove(os.path.join(STORAGE_DIR, p))
+            path = os.path.join(STORAGE_DIR, p)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        for getter in (get_modern_yarn_versions_cached, get_legacy_yarn_versions_cached,
+                       get_manifest_cache, get_manifest_index):
+            getter.cache_clear()
     elif sys.argv[1] in ["list_versions", "versions"]:
         types = " ".join(sys.argv[2:]).strip().split(",")
         types = [t.strip() for t in types if len(t.strip())]
@@ -347,10 +467,9 @@ def main():
             if t not in ["snapshot", "release", "old_beta", "old_alpha"]:
                 print(f"Unknown version type '{t}'")
                 exit(1)
-        versions = get_manifest_cache()["versions"]
-        versions = [v for v in versions if v["type"] in types]
-        for v in versions:
-            print(v["id"])
+        for v in get_manifest_index().values():
+            if v["type"] in types:
+                print(v["id"])
     elif sys.argv[1] == "get_jar":
         if len(sys.argv) == 2:
             print("Missing argument: version")
@@ -19,15 +19,19 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 
 import enum
+import re
 from typing import *
 from string import digits, ascii_letters, punctuation, whitespace, hexdigits
 
 from io import StringIO
 
-from dataclasses import dataclass, replace
+from dataclasses import dataclass
 
 
-@dataclass(frozen=True)
+# Indentation strings by width, so indent() need not build one each call
+_INDENTS = tuple(" " * i for i in range(128))
+
+@dataclass(frozen=True, slots=True)
 class SerializationCtx:
     # ===== Formatting settings =====
     
@@ -53,23 +57,89 @@ class SerializationCtx:
     
 
 
+    # These run for every container node, so they call the constructor
+    # directly rather than going through dataclasses.replace, which costs
+    # about twice as much. Every field is passed by name, so a new field
+    # must be added to both.
     def mutate_for_oneliner(self) -> 'SerializationCtx':
-        return replace(self, DO_NEWLINE = False)
+        return SerializationCtx(
+            DO_STRIP_COMMENTS=self.DO_STRIP_COMMENTS,
+            DO_INDENTATION=self.DO_INDENTATION,
+            DO_LEADING_COMMA=self.DO_LEADING_COMMA,
+            DO_NEWLINE=False,
+            INDENTATION_MULTIPLIER=self.INDENTATION_MULTIPLIER,
+            ONELINER_THRESHOLD=self.ONELINER_THRESHOLD,
+            indentation_level=self.indentation_level,
+        )
 
 
     def mutate_for_indentation(self) -> 'SerializationCtx':
-        return replace(self, indentation_level = self.indentation_level + 1 )
+        return SerializationCtx(
+            DO_STRIP_COMMENTS=self.DO_STRIP_COMMENTS,
+            DO_INDENTATION=self.DO_INDENTATION,
+            DO_LEADING_COMMA=self.DO_LEADING_COMMA,
+            DO_NEWLINE=self.DO_NEWLINE,
+            INDENTATION_MULTIPLIER=self.INDENTATION_MULTIPLIER,
+            ONELINER_THRESHOLD=self.ONELINER_THRESHOLD,
+            indentation_level=self.indentation_level + 1,
+        )
 
     def indent(self) -> str:
-        return (" " * (self.indentation_level * self.INDENTATION_MULTIPLIER) ) if self.DO_INDENTATION else ""
+        if not self.DO_INDENTATION:
+            return ""
+        width = self.indentation_level * self.INDENTATION_MULTIPLIER
+        return _INDENTS[width] if 0 <= width < len(_INDENTS) else " " * width
 
 
 class DeserializationError(Exception):
     pass
+
+# Skips whitespace, then takes the next char
+SKIP_WHITESPACE_RE = re.compile("[" + re.escape(whitespace) + "]*(.?)", re.S)
+
+@dataclass(slots=True)
+class Cursor:
+    """ A position within the text being parsed """
+    buf : str
+    pos : int = 0
+
+    def read(self) -> str:
+        """ Take the next char, or '' at the end of the text """
+        c = self.buf[self.pos:self.pos + 1]
+        self.pos += len(c)
+        return c
+
+    def unread(self):
+        self.pos -= 1
+
+    def read_after(self, skip : re.Pattern) -> str:
+        """
+        Skip past a pattern ending with (.?), then take the char it
+        captured, or '' at the end of the text
+        """
+        m = skip.match(self.buf, self.pos)
+        self.pos = m.end()
+        return m.group(1)
+
+    def match(self, pattern : re.Pattern) -> re.Match | None:
+        """ Match a pattern here, moving past it if it matched """
+        m = pattern.match(self.buf, self.pos)
+        if m is not None:
+            self.pos = m.end()
+        return m
+
+    def rest(self) -> str:
+        """ Take everything that is left """
+        rest = self.buf[self.pos:]
+        self.pos = len(self.buf)
+        return rest
+
 def SerializationError(Exception):
     pass
 
 class ProtoNode:
+    __slots__ = ()
+
     def __init__(self):
         raise Exception("CANNOT INIT BASE") 
 
@@ -93,17 +163,43 @@ class ProtoNode:
             - Assume this item is currently indented
             - The SerializationCtx is all the function knows or cares about
 
+        Nodes containing other nodes implement serialize_to instead, so
+        this is then only a wrapper around it.
         """
-        raise Exception("Not implmented")
+        if type(self).serialize_to is ProtoNode.serialize_to:
+            raise Exception("Not implmented")
+        out = StringIO()
+        self.serialize_to(ctx, out)
+        return out.getvalue()
+
+    def serialize_to(self, ctx : SerializationCtx, out : StringIO):
+        """
+        Same as serialize, but writes to out instead of returning a string,
+        so nested nodes write into one buffer rather than each copying the
+        text of all their children.
+        """
+        out.write(self.serialize(ctx))
+
+    @classmethod
+    def Deserialize(cls, stream : StringIO, allow_comments = False, **kwargs) -> 'ProtoNode':
+        """
+        Parse from a stream, see Parse. The stream is read once, and left
+        directly after the thing that was parsed.
+        """
+        start = stream.tell()
+        cursor = Cursor(stream.read())
+        node = cls.Parse(cursor, allow_comments, **kwargs)
+        stream.seek(start + cursor.pos)
+        return node
 
     @classmethod
-    def Deserialize(cls, stream : StringIO, allow_comments = False) -> 'ProtoNode':
+    def Parse(cls, cursor : Cursor, allow_comments = False) -> 'ProtoNode':
         """
         Parse from string. 
 
         Conventions: 
-            - Stream should be set the first char of the token
-            - At return the stream should be put directly at the 
+            - Cursor should be set the first char of the token
+            - At return the cursor should be put directly at the 
               of the thing being parsed. It it the callers responsibility
               to handle ws
 
@@ -112,6 +208,8 @@ class ProtoNode:
         raise Exception("Not implmented")
 
 class ProtoString(ProtoNode):
+    __slots__ = ('raw_contents',)
+
     ESCAPE_DICT = {
             'a': '\a',
             'b': '\b',
@@ -130,17 +228,32 @@ class ProtoString(ProtoNode):
 
     VALID_LETTERS = digits + ascii_letters + punctuation + " "
 
+    # Everything in ESCAPE_DICT is escaped with str.replace, the only
+    # letters left that are not in VALID_LETTERS then get hex escaped.
+    # The backslash must go first, so it does not re-escape the others
+    ESCAPE_ORDER = sorted(ESCAPE_DICT_REVERSED.items(), key=lambda kv: kv[0] != '\\')
+    INVALID_LETTER_RE = re.compile("[^" + re.escape(VALID_LETTERS) + "]")
+
+    # Any char that escape_string would change
+    NEEDS_ESCAPE_RE = re.compile("[^" + re.escape(VALID_LETTERS.translate({ord(c): None for c in "\\'\""})) + "]")
+
     @classmethod
     def escape_string(cls, unescaped : str) -> str:
-        escaped = ""   
-        for c in unescaped:
-            if c in cls.ESCAPE_DICT_REVERSED:
-                escaped += "\\" + cls.ESCAPE_DICT_REVERSED[c]
-            elif c in cls.VALID_LETTERS:
-                escaped += c
-            else:
-                escaped += "\\x" + format(ord(c), "x")
-        return escaped
+        # Most strings have nothing to escape. isascii() is O(1), and
+        # anything non ASCII needs escaping regardless.
+        if unescaped.isascii() and cls.NEEDS_ESCAPE_RE.search(unescaped) is None:
+            return unescaped
+
+        for c, e in cls.ESCAPE_ORDER:
+            unescaped = unescaped.replace(c, "\\" + e)
+        return cls.INVALID_LETTER_RE.sub(
+            lambda m: "\\x" + format(ord(m.group()), "x"),
+            unescaped
+        )
+
+    # The contents, then either the closing quote, a backslash that does
+    # not start a known escape, or nothing if the string never ends
+    STRING_RE = re.compile(r'"((?:[^"\\]|\\[' + re.escape("".join(ESCAPE_DICT)) + r'])*)(["\\]?)')
 
     raw_contents : str
     def __init__(self, raw_contents : str):
@@ -150,29 +263,32 @@ class ProtoString(ProtoNode):
         return f"\"{self.raw_contents}\""
 
     @classmethod
-    def Deserialize(cls, stream: StringIO, allow_comments=False) -> 'ProtoNode':
-        raw = ""
-
-        first = stream.read(1)
+    def Parse(cls, cursor: Cursor, allow_comments=False) -> 'ProtoNode':
+        m = cursor.match(cls.STRING_RE)
 
-        if first != '"':
+        if m is None:
             raise DeserializationError("Unexpected start of string")
 
-        isEscaped = False
-        while '"' != (c := stream.read(1)) or isEscaped:
-            if isEscaped and c not in cls.ESCAPE_DICT:
-                raise DeserializationError(f"Cannot parse string due to unknown escaped charicter: {c}")
-            
-
-            raw += c
-            isEscaped = not isEscaped and c == '\\'
+        raw, end = m.groups()
+        if end == '\\':
+            raise DeserializationError(f"Cannot parse string due to unknown escaped charicter: {cursor.read()}")
+        if end == '':
+            raise DeserializationError("Unexpected EOF")
         return ProtoString(raw)
             
 class ProtoNumber(ProtoNode):
+    __slots__ = ('raw_contents',)
+
     raw_contents : str
     
 
     VALID_CONTENTS = hexdigits + "xXbB_.-" 
+    NUMBER_RE = re.compile("[" + re.escape(VALID_CONTENTS) + "]*")
+
+    # Finds the first char that is not valid in each mode
+    INVALID_HEX_RE = re.compile("[^" + hexdigits + "_]")
+    INVALID_BINARY_RE = re.compile("[^01_]")
+    INVALID_DECIMAL_RE = re.compile("[^" + digits + "\\-_.]")
 
     def __init__(self, raw_contents : str):
         self.raw_contents = raw_contents
@@ -182,118 +298,168 @@ class ProtoNumber(ProtoNode):
     
     
     @classmethod
-    def Deserialize(cls, stream: StringIO, allow_comments=False) -> 'ProtoNode':
-        raw = ""
-        while (c := stream.read(1)) in cls.VALID_CONTENTS and c != '':
-            raw += c
-        if c != '':
-            stream.seek(stream.tell() - 1)
-        
+    def Parse(cls, cursor: Cursor, allow_comments=False) -> 'ProtoNode':
+        raw = cursor.match(cls.NUMBER_RE).group()
 
         # Validate
-        if raw.startswith('0x') or raw.startswith('0X'):
-            for c in raw[2:]:
-                if c not in hexdigits + '_':
-                    raise DeserializationError(f"Invalid number in hex mode: {c}")
-        elif raw.startswith('0b') or raw.startswith('0B'):
-            for c in raw[2:]:
-                if c not in '01_':
-                    raise DeserializationError(f'Invalid number in binary mode: {c}')
+        if raw.startswith(('0x', '0X')):
+            mode, invalid = "hex", cls.INVALID_HEX_RE.search(raw, 2)
+        elif raw.startswith(('0b', '0B')):
+            mode, invalid = "binary", cls.INVALID_BINARY_RE.search(raw, 2)
         else:
-            for c in raw:
-                if c not in digits + "-_.":
-                    raise DeserializationError(f'Invalid number in decimal mode: {c}')
+            mode, invalid = "decimal", cls.INVALID_DECIMAL_RE.search(raw)
+        if invalid is not None:
+            raise DeserializationError(f"Invalid number in {mode} mode: {invalid.group()}")
 
 
         return ProtoNumber(raw)
 
 
 class ListStyle(enum.Enum):
-    ROOT = enum.auto()
+    # (start token, end token)
+    ROOT = ('', '')
 
-    PARAM = enum.auto()
+    PARAM = ('(', ')')
 
-    BRACKET = enum.auto()
+    BRACKET = ('[', ']')
 
     # Not use within the nowmal protolist
-    CURLY_BRACKET = enum.auto()
+    CURLY_BRACKET = ('{', '}')
+
+    def __init__(self, start : str, end : str):
+        self._start = start
+        self._end = end
 
 
     def end_token(self) -> str:
-        return {
-            self.ROOT: '',
-            self.PARAM: ')',
-            self.BRACKET: ']',
-            self.CURLY_BRACKET: '}'
-        }[self]
+        return self._end
     
     def start_token(self) -> str:
-        return {
-            self.ROOT: '',
-            self.PARAM: '(',
-            self.BRACKET: '[',
-            self.CURLY_BRACKET: '{'
-        }[self]
+        return self._start
 
 class ProtoList(ProtoNode):
+    __slots__ = ('style', 'contents', '_size')
+
+    STYLES = {
+        '(' : ListStyle.PARAM,
+        '[' : ListStyle.BRACKET
+    }
+
     style : ListStyle
     contents : List[ProtoNode]
+
+    # Every enclosing list asks again while serializing, so it is kept
+    # after the first walk. Nodes are not changed after construction.
+    _size : int | None
     def __init__(self, contents : List[ProtoNode], style : ListStyle):
         self.style = style
         self.contents = contents
+        self._size = None
 
     def determine_size(self) -> int:
-        return max(1, len(self.contents)) + max((0, *(c.determine_size() for c in self.contents)))
+        if self._size is None:
+            self._size = max(1, len(self.contents)) + max((0, *(c.determine_size() for c in self.contents)))
+        return self._size
 
     def contains_forced_newline(self) -> bool:
         return any((c.contains_forced_newline() for c in self.contents))
 
-    def serialize(self, ctx: SerializationCtx) -> str:
-        out = self.style.start_token()
+    def leaf_strings(self) -> List[str] | None:
+        """ The serialized children, or None unless all are numbers and strings """
+        leaves = []
+        append = leaves.append
+        for c in self.contents:
+            t = type(c)
+            if t is ProtoNumber:
+                append(c.raw_contents)
+            elif t is ProtoString:
+                append(f"\"{c.raw_contents}\"")
+            else:
+                return None
+        return leaves
+
+    def serialize_to(self, ctx: SerializationCtx, out: StringIO):
+        write = out.write
+        write(self.style.start_token())
 
         # Determine if a oneliner is required
         if self.determine_size() <= ctx.ONELINER_THRESHOLD and not self.contains_forced_newline():
             ctx = ctx.mutate_for_oneliner()
 
-        had_previous_forced_nl = False
         child_ctx_base = ctx.mutate_for_indentation()
+        if child_ctx_base.DO_NEWLINE:
+            self._serialize_multiline(child_ctx_base, out)
+        else:
+            self._serialize_oneliner(child_ctx_base, out)
 
+        if ctx.DO_NEWLINE:
+            write('\n')
+            if ctx.DO_INDENTATION:
+                write(ctx.indent())
+        write(self.style.end_token())
+
+    def _serialize_oneliner(self, child_ctx_base: SerializationCtx, out: StringIO):
+        """ Write the children, all on one line, separated by ', ' """
+        write = out.write
+
+        # Leaves have nothing to format, and can never force a newline,
+        # so they reduce to one join over their text
+        leaves = self.leaf_strings()
+        if leaves is not None:
+            write(', '.join(leaves))
+            return
+
+        strip_comments = child_ctx_base.DO_STRIP_COMMENTS
+        last = len(self.contents) - 1
         for i, c in enumerate(self.contents):
-            if child_ctx_base.DO_STRIP_COMMENTS and c.style_comment():
+            is_comment = c.style_comment()
+            if strip_comments and is_comment:
                 continue
 
+            c.serialize_to(child_ctx_base, out)
 
-            if child_ctx_base.DO_NEWLINE and not had_previous_forced_nl:
-                out += '\n'
-            if child_ctx_base.DO_NEWLINE:
-                out += child_ctx_base.indent()
+            if not is_comment and i != last:
+                write(', ')
 
-            out += c.serialize(child_ctx_base)
-            had_previous_forced_nl = c.style_comment()
+    def _serialize_multiline(self, child_ctx_base: SerializationCtx, out: StringIO):
+        """ Write the children, each on their own indented line """
+        write = out.write
+        child_indent = child_ctx_base.indent()
 
+        # See _serialize_oneliner
+        leaves = self.leaf_strings() if self.contents else None
+        if leaves is not None:
+            lead = '\n' + child_indent
+            write(lead)
+            write((',' + lead).join(leaves))
+            if child_ctx_base.DO_LEADING_COMMA:
+                write(',')
+            return
 
-            
-            if not c.style_comment() and ((child_ctx_base.DO_LEADING_COMMA and child_ctx_base.DO_NEWLINE) or i+1 != len(self.contents) ):
-                out += ','
-                if not child_ctx_base.DO_NEWLINE:
-                    out += ' '
-            
+        strip_comments = child_ctx_base.DO_STRIP_COMMENTS
+        leading_comma = child_ctx_base.DO_LEADING_COMMA
+        had_previous_forced_nl = False
+        last = len(self.contents) - 1
+        for i, c in enumerate(self.contents):
+            is_comment = c.style_comment()
+            if strip_comments and is_comment:
+                continue
 
-        if ctx.DO_NEWLINE:
-            out += '\n'
-            if ctx.DO_INDENTATION:
-                out += ctx.indent()
-        out += self.style.end_token()
-        return out
+            if not had_previous_forced_nl:
+                write('\n')
+            write(child_indent)
+
+            c.serialize_to(child_ctx_base, out)
+            had_previous_forced_nl = is_comment
+
+            if not is_comment and (leading_comma or i != last):
+                write(',')
 
     @classmethod
-    def Deserialize(cls, stream: StringIO, allow_comments=False, force_root : bool = False) -> 'ProtoNode':
-        first = stream.read(1) if not force_root else ''
+    def Parse(cls, cursor: Cursor, allow_comments=False, force_root : bool = False) -> 'ProtoNode':
+        first = cursor.read() if not force_root else ''
 
-        style = ListStyle.ROOT if force_root else {
-            '(' : ListStyle.PARAM,
-            '[' : ListStyle.BRACKET
-        }.get(first)
+        style = ListStyle.ROOT if force_root else cls.STYLES.get(first)
 
         if style is None:
             raise DeserializationError(f"Unknown begining token for list: {first}")
@@ -302,30 +468,28 @@ class ProtoList(ProtoNode):
         ender = style.end_token()
 
         contents = []
+        skip = _SKIP_TO_NODE[ender]
 
 
-        while (c := stream.read(1)) != ender and c != '':
-            id = identify_protonode(c)
-
-            if id is None:
-                continue
-
-            stream.seek(stream.tell() - 1)
-            node = id.Deserialize(stream)
+        while (c := cursor.read_after(skip)) != ender and c != '':
+            cursor.unread()
+            # The skip stops only on node starts, which are all ASCII
+            node = _PROTONODE_DISPATCH[ord(c)].Parse(cursor)
 
             if not(type(node) is ProtoComment and not allow_comments):
                 contents.append(node)
 
 
-            while (c := stream.read(1)) != ender and c != ',':
-                if c not in whitespace:
-                    raise DeserializationError(f"Parsing error: {c}{stream.read()}")
-            if c == ender:
+            if (c := cursor.read_after(SKIP_WHITESPACE_RE)) == ender:
                 break
+            if c != ',':
+                raise DeserializationError(f"Parsing error: {c}{cursor.rest()}")
         return ProtoList(contents, style) 
 
 
 class _ProtoKV(ProtoNode):
+    __slots__ = ('key', 'value')
+
     key : ProtoNode
     value : ProtoNode
     def __init__(self, key : ProtoNode, value : ProtoNode):
@@ -339,71 +503,75 @@ class _ProtoKV(ProtoNode):
         return self.key.contains_forced_newline() or self.value.contains_forced_newline()
     
     @classmethod
-    def Deserialize(cls, stream: StringIO, allow_comments=False) -> 'ProtoNode':
+    def Parse(cls, cursor: Cursor, allow_comments=False) -> 'ProtoNode':
         raise Exception("Cannot parse ProtoKV")
 
-    def serialize(self, ctx: SerializationCtx) -> str:
-        return self.key.serialize(ctx) + ": " + self.value.serialize(ctx)
+    def serialize_to(self, ctx: SerializationCtx, out: StringIO):
+        self.key.serialize_to(ctx, out)
+        out.write(": ")
+        self.value.serialize_to(ctx, out)
 
 
 class ProtoDict(ProtoList):
+    __slots__ = ()
 
     contents : List['_ProtoKV | ProtoComment']
-    def __init__(self, contents : List[Tuple[ProtoNode, ProtoNode] | 'ProtoComment']):
+    def __init__(self, contents : List[Tuple[ProtoNode, ProtoNode] | '_ProtoKV | ProtoComment']):
         self.contents = [_ProtoKV(c[0], c[1]) if type(c) is tuple else c for c in contents]
         self.style = ListStyle.CURLY_BRACKET
+        self._size = None
 
 
     @classmethod
-    def Deserialize(cls, stream: StringIO, allow_comments=False) -> 'ProtoNode':
-        if stream.read(1) != '{':
+    def Parse(cls, cursor: Cursor, allow_comments=False) -> 'ProtoNode':
+        if cursor.read() != '{':
             raise DeserializationError("Unexpected head of dict")
 
         contents = []
-        while (c := stream.read(1)) != '}':
+        while True:
+            # Skip ws and commas
+            if (c := cursor.read_after(_SKIP_TO_NODE['}'])) == '}':
+                break
             if c == '':
                 raise DeserializationError('Unexpected EOF')
+            cursor.unread()
 
-            if c == ',':
-                continue
-            
-            k_id = identify_protonode(c)
-
-            if k_id is None:
-                # Skip ws
-                continue
-            stream.seek(stream.tell() - 1)
-
-            key : ProtoNode = k_id.Deserialize(stream)
+            # As in ProtoList.Parse, c always starts a node
+            key : ProtoNode = _PROTONODE_DISPATCH[ord(c)].Parse(cursor)
 
             if type(key) is ProtoComment:
                 if allow_comments:
                     contents.append(key)
                 continue
             
-            while (c := stream.read(1)) != ':':
-                if c not in whitespace:
-                    raise DeserializationError(f"Unexpected token {c}")
-                if c == '':
-                    raise DeserializationError("Unexpected EOF")
-            while (v_id := identify_protonode(c := stream.read(1))) is None:
-                if c == '':
-                    raise DeserializationError("Unexpected EOF")
-            stream.seek(stream.tell() - 1)
-
-            value : ProtoNode = v_id.Deserialize(stream)
+            if (c := cursor.read_after(SKIP_WHITESPACE_RE)) == '':
+                raise DeserializationError("Unexpected EOF")
+            if c != ':':
+                raise DeserializationError(f"Unexpected token {c}")
+            if (c := cursor.read_after(_SKIP_TO_NODE[''])) == '':
+                raise DeserializationError("Unexpected EOF")
+            cursor.unread()
+
+            value : ProtoNode = _PROTONODE_DISPATCH[ord(c)].Parse(cursor)
             
-            contents.append((key, value))
+            contents.append(_ProtoKV(key, value))
         return ProtoDict(contents)
 
 
 class ProtoType(ProtoNode):
+    __slots__ = ('name', 'attached_params', 'attached_list', 'attached_dict', '_size')
+
+    NAME_RE = re.compile("[" + re.escape(ascii_letters + "_") + "]*")
+
     name : str
 
     attached_params : None | ProtoList
     attached_list : None | ProtoList
     attached_dict : None | ProtoDict
 
+    # Cached like ProtoList._size
+    _size : int | None
+
     def __init__(self, name : str,
                 attached_params : None | ProtoList,
                 attached_list : None | ProtoList,
@@ -412,42 +580,45 @@ class ProtoType(ProtoNode):
         self.attached_params = attached_params
         self.attached_list = attached_list
         self.attached_dict = attached_dict
+        self._size = None
 
     def determine_size(self) -> int:
-        return 1 + (
-            (self.attached_dict.determine_size() if self.attached_dict is not None else 0)
-            +
-            (self.attached_list.determine_size() if self.attached_list is not None else 0)
-            +
-            (self.attached_params.determine_size() if self.attached_params is not None else 0)
-        )
+        if self._size is None:
+            self._size = 1 + (
+                (self.attached_dict.determine_size() if self.attached_dict is not None else 0)
+                +
+                (self.attached_list.determine_size() if self.attached_list is not None else 0)
+                +
+                (self.attached_params.determine_size() if self.attached_params is not None else 0)
+            )
+        return self._size
     def contains_forced_newline(self) -> bool:
-        return any(
-            self.attached_params is not None and self.attached_params.contains_forced_newline(),
-            self.attached_list is not None and self.attached_list.contains_forced_newline(),
-            self.attached_dict is not None and self.attached_dict.contains_forced_newline()
+        return (
+            (self.attached_params is not None and self.attached_params.contains_forced_newline())
+            or
+            (self.attached_list is not None and self.attached_list.contains_forced_newline())
+            or
+            (self.attached_dict is not None and self.attached_dict.contains_forced_newline())
         )
 
-    def serialize(self, ctx: SerializationCtx) -> str:
-        out = self.name
+    def serialize_to(self, ctx: SerializationCtx, out: StringIO):
+        out.write(self.name)
 
 
         base_ctx_child = ctx.mutate_for_indentation()
 
         if self.attached_params is not None:
-            out += self.attached_params.serialize(base_ctx_child)
+            self.attached_params.serialize_to(base_ctx_child, out)
         if self.attached_list is not None:
-            out += self.attached_list.serialize(base_ctx_child)
+            self.attached_list.serialize_to(base_ctx_child, out)
         if self.attached_dict is not None:
-            out += self.attached_dict.serialize(base_ctx_child)
-        return out
+            self.attached_dict.serialize_to(base_ctx_child, out)
 
 
     @classmethod
-    def Deserialize(cls, stream: StringIO, allow_comments=False) -> 'ProtoNode':
-        name = ""
-        while (c := stream.read(1)) in (ascii_letters + "_"):
-            name += c
+    def Parse(cls, cursor: Cursor, allow_comments=False) -> 'ProtoNode':
+        name = cursor.match(cls.NAME_RE).group()
+        c = cursor.read_after(SKIP_WHITESPACE_RE)
 
 
         params = None
@@ -460,31 +631,36 @@ class ProtoType(ProtoNode):
                 if lIst is not None:
                     raise DeserializationError("Multiple attached lists are not legal")
 
-                stream.seek(stream.tell() - 1)
-                lIst = ProtoList.Deserialize(stream, allow_comments=allow_comments)
+                cursor.unread()
+                lIst = ProtoList.Parse(cursor, allow_comments=allow_comments)
             elif c == '(':
                 if params is not None:
                     raise DeserializationError("Multiple attached params are not legal")
 
-                stream.seek(stream.tell() - 1)
-                params = ProtoList.Deserialize(stream, allow_comments=allow_comments)
+                cursor.unread()
+                params = ProtoList.Parse(cursor, allow_comments=allow_comments)
             elif c == '{':
                 if dIct is not None:
                     raise DeserializationError("Multiple attached dicts are not legal")
 
-                stream.seek(stream.tell() - 1)
-                dIct = ProtoDict.Deserialize(stream, allow_comments=allow_comments)
-            elif c not in whitespace:
+                cursor.unread()
+                dIct = ProtoDict.Parse(cursor, allow_comments=allow_comments)
+            else:
                 raise DeserializationError(f"Unknown char found in Object: '{c}'")
  
-            c = stream.read(1)
+            c = cursor.read_after(SKIP_WHITESPACE_RE)
 
         if c in (']', ')', '}'):
-            stream.seek(stream.tell() - 1)
+            cursor.unread()
         return ProtoType(name, params, lIst, dIct)
             
 
 class ProtoComment(ProtoNode):
+    __slots__ = ('contents',)
+
+    # Everything up to and including the newline
+    COMMENT_RE = re.compile("#([^\n]*)\n?")
+
     contents : str
     def __init__(self, contents : str):
         self.contents = contents
@@ -497,39 +673,41 @@ class ProtoComment(ProtoNode):
 
 
     @classmethod
-    def Deserialize(cls, stream: StringIO, allow_comments=False) -> 'ProtoNode':
-        if stream.read(1) != '#':
+    def Parse(cls, cursor: Cursor, allow_comments=False) -> 'ProtoNode':
+        m = cursor.match(cls.COMMENT_RE)
+        if m is None:
             raise DeserializationError("Unexpected head of ProtoComment")
 
-
-        contents = ''
-
-        while (c := stream.read(1)) != '\n' and c != '':
-            contents += c
-
-        return ProtoComment(contents.strip())
+        return ProtoComment(m.group(1).strip())
     
     def serialize(self, ctx: SerializationCtx) -> str:
         return f"# {self.contents}\n" 
 
 
+# What node starts with each ASCII char, anything else is skipped
+_PROTONODE_DISPATCH = [None] * 128
+for _c, _node in (
+        ("([", ProtoList),
+        ("{", ProtoDict),
+        ('"', ProtoString),
+        (digits + '-', ProtoNumber),
+        (ascii_letters, ProtoType),
+        ('#', ProtoComment)):
+    for _c in _c:
+        _PROTONODE_DISPATCH[ord(_c)] = _node
+_PROTONODE_DISPATCH = tuple(_PROTONODE_DISPATCH)
+del _c, _node
+
+# For the end token of each list style, skips everything up to either
+# something that starts a node, or the end of the list (for read_after)
+_NODE_STARTS = "".join(chr(i) for i, node in enumerate(_PROTONODE_DISPATCH) if node is not None)
+_SKIP_TO_NODE = {
+    style.end_token(): re.compile("[^" + re.escape(_NODE_STARTS + style.end_token()) + "]*(.?)", re.S)
+    for style in ListStyle
+}
+
 def identify_protonode(char : str) -> Type | None:
-    if char in "([":
-        return ProtoList
-    if char == "{":
-        return ProtoDict
-
-    if char in whitespace:
-        return None
-    if char == '"':
-        return ProtoString
-    if char in digits + '-':
-        return ProtoNumber
-
-    if char in ascii_letters:
-        return ProtoType
-    if char == '#':
-        return ProtoComment
+    return _PROTONODE_DISPATCH[ord(char)] if char and char < '\x80' else None
         
 if __name__ == "__main__":
     i = StringIO("""{
@@ -0,0 +1,47 @@
+"""
+Where gryla keeps its caches on disk. This module only works out the
+path, it creates nothing, so any script can import it cheaply.
+
+Copyright (C) 2025 - PsychedelicPalimpsest
+
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import os
+import platform
+
+
+def get_storage_dir() -> str:
+    os_name = platform.system()
+
+    # Highest priority: explicit override
+    if "GRYLA_HOME" in os.environ:
+        return os.path.expanduser(os.environ["GRYLA_HOME"])
+
+    if os_name == "Linux":
+        base = os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+        return os.path.join(base, "gryla")
+
+    if os_name == "Darwin":  # macOS
+        return os.path.expanduser("~/Library/Caches/gryla")
+
+    if os_name == "Windows":
+        local_appdata = os.environ.get("LOCALAPPDATA")
+        if local_appdata is not None:
+            return os.path.join(local_appdata, "gryla", "Cache")
+
+    # Fallback if unknown system
+    raise RuntimeError(f"Cannot determine cache directory on {os_name}")
+
+STORAGE_DIR = get_storage_dir()
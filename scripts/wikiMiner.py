@@ -24,17 +24,73 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 
 from typing import *
+import os, re, sys
+import pickle
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 from dataclasses import dataclass
-BASE_URL = "https://minecraft.wiki/api.php?action=query&format=json&prop=revisions&rvslots=*&rvprop=content&revids={}"
+from storage import STORAGE_DIR
 
+try:
+    import requests_cache
+except ImportError:
+    requests_cache = None
 
 
-def consume_line(x : str) -> Tuple[str, str | None]:
-    i = x.find('\n')
-    return (x, None) if i == -1 else (x[:i].rstrip(), x[i+1:])
+API_URL = "https://minecraft.wiki/api.php"
 
-@dataclass
+# Every revision query asks for the same things, only the revids change.
+# Given as params, requests builds (and encodes) the query string itself
+API_PARAMS = {"action": "query", "format": "json", "prop": "revisions", "rvslots": "*", "rvprop": "ids|content"}
+
+# The most revids the MediaWiki api will accept in a single query
+MAX_REVIDS_PER_QUERY = 50
+
+# How many queries may be in flight against the wiki at once
+MAX_CONCURRENT_QUERIES = 4
+
+# Seconds to wait on the wiki before giving up on a query
+REQUEST_TIMEOUT = 30
+
+# Shared by every wiki fetch so the connection is reused. If requests_cache
+# is installed, responses also persist on disk for a day between runs.
+if requests_cache is not None:
+    os.makedirs(STORAGE_DIR, exist_ok=True)
+    SESSION = requests_cache.CachedSession(os.path.join(STORAGE_DIR, "wiki_cache"), expire_after=86400)
+else:
+    SESSION = requests.Session()
+
+# Parsed Wiki trees are pickled here, one file per oldid, so a re-run skips
+# both the fetch and the parse. Bump the version whenever Wiki changes shape
+PARSED_CACHE_DIR = os.path.join(STORAGE_DIR, "parsed")
+PARSED_CACHE_VERSION = 2
+
+# Keep a connection open for each concurrent query, and ride out the
+# wiki's occasional 5xx responses instead of failing the whole run
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=MAX_CONCURRENT_QUERIES,
+    pool_maxsize=MAX_CONCURRENT_QUERIES * 2,
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=(500, 502, 503, 504))
+))
+
+def _fetch_revisions(revids : List[int]) -> List[Dict]:
+    jso = SESSION.get(API_URL, params={**API_PARAMS, "revids": "|".join(map(str, revids))}, timeout=REQUEST_TIMEOUT).json()
+    return [revision for page in jso["query"]["pages"].values() for revision in page["revisions"]]
+
+# Classifies one wikitable line: the table end, a row separator, a cell, or
+# (when kind is absent) a continuation of the previous cell
+_LINE_RE = re.compile(r'[^\S\n]*(?:(?P<end>\|\})|(?P<kind>[|!])[^\S\n]*(?P<row>-)?)?(?P<rest>[^\n]*)\n')
+
+# Matches a single cell argument, eg: colspan="2"
+_ATTR_RE = re.compile(r'(colspan|rowspan)="(\d+)"\s*')
+
+# Strings shorter than this are interned when they land in a cell, a Wiki or a type
+MAX_INTERN_LEN = 128
+
+
+@dataclass(slots=True)
 class WikitableCell:
     content : str
     
@@ -46,8 +102,16 @@ class WikitableCell:
     rowspan : int = 1
     colspan : int = 1
 
+    def __post_init__(self):
+        # Type names and field names repeat across thousands of cells, so
+        # share one copy of the short ones. Long prose is rarely repeated
+        if len(self.content) < MAX_INTERN_LEN:
+            self.content = sys.intern(self.content)
+
 
 class WikiTable:
+    __slots__ = ('rows', 'width', 'height', '_index', '_headers')
+
     rows : List[List[WikitableCell]]
 
     width : int
@@ -58,6 +122,12 @@ class WikiTable:
 
         self.width = width
         self.height = height
+
+        # Lookup for get(), built once instead of scanning a row per call
+        self._index = {(cell.x, cell.y): cell for row in rows for cell in row}
+
+        # Headers can only exist on the first row
+        self._headers = [cell for cell in rows[0] if cell.isHeader] if rows else []
     @classmethod
     def From_txt(cls, txt : str) -> Tuple['WikiTable', str | None]:
         """
@@ -73,42 +143,56 @@ class WikiTable:
         rows = []
         curRow = []
 
-        line1, head = consume_line(txt)
+        head = None
 
-        rowspans = []
+        # For each later row that cells span into, maps every covered
+        # column to how far a cell landing on it is pushed right
+        covered : Dict[int, Dict[int, int]] = {}
+        row_covered : Dict[int, int] = {}
 
-        assert line1.strip().startswith("{|")
-        assert head is not None
+        firstEnd = txt.find('\n')
+        assert txt[:firstEnd].strip().startswith("{|")
+        assert firstEnd != -1
+
+        # Continuation lines of the last cell in curRow, only joined
+        # onto its content once the cell is complete
+        contParts = []
 
         x, y = 0, 0
         width = -1
         height = -1
 
-        while True:
-            line, head = consume_line(head)
-            line = line.lstrip()
+        # A line without a trailing newline is the end of the file, and is never
+        # matched, so the loop only ever sees complete lines
+        attrMatch = _ATTR_RE.match
+        for m in _LINE_RE.finditer(txt, firstEnd + 1):
+            end, kind, isRow, line = m.groups()
 
-            
-            # handle end of tables/files
-            if head is None or line.lstrip().startswith("|}"):
+            # handle end of tables
+            if end:
+                head = txt[m.end():]
                 break
 
-            if not len(line):
-                continue
+            line = line.rstrip()
 
             # handle invalid lines
-            if line[0] != '!' and line[0] != '|' and len(line.strip()) != 0:
+            if kind is None:
+                if not len(line):
+                    continue
                 if len(curRow) == 0:
                    raise ValueError(f"Cannot parse WikiTable due to line: \"{line}\"")
                 else:
-                    curRow[-1].content += "\n" + line
+                    contParts.append(line)
                 continue
 
-            isHeader = line and line[0] == "!"
-            line = line[1:].lstrip()
+            if contParts:
+                curRow[-1].content = "\n".join((curRow[-1].content, *contParts))
+                contParts = []
+
+            isHeader = kind == "!"
             
             # handle new rows
-            if line and line[0] == "-":
+            if isRow:
                 if y == 0 and len(curRow) == 0:
                     # WTF??????
                     continue
@@ -123,34 +207,23 @@ class WikiTable:
                 rows.append(curRow)
                 curRow = []
 
-                rowspans = [cell for cell in rowspans if cell.y + cell.rowspan > y]
+                row_covered = covered.pop(y, {})
                 continue
 
             # skip over large cells
-            while True:
-                for cell in rowspans:
-                    isOverlapping = cell.x <= x and cell.y <= y and cell.x + cell.colspan > x and cell.y + cell.rowspan > y
-                    if not isOverlapping:
-                        continue
-                    x += cell.colspan
-                    break
-                else:
-                    break
+            while (skip := row_covered.get(x)):
+                x += skip
 
             # parse arguments
             cellColspan = 1
             cellRowspan = 1
-            while True:
-                if line.startswith("colspan="):
-                    cellColspan = int(line.split('"')[1])
-                    line = line[line.find('"') + 1:]
-                    line = line[line.find('"') + 1:].lstrip()
-                elif line.startswith("rowspan="):
-                    cellRowspan = int(line.split('"')[1])
-                    line = line[line.find('"') + 1:]
-                    line = line[line.find('"') + 1:].lstrip()
+            while (m := attrMatch(line)):
+                attr, value = m.groups()
+                if attr == "colspan":
+                    cellColspan = int(value)
                 else:
-                    break
+                    cellRowspan = int(value)
+                line = line[m.end():]
 
             if line.startswith('|'):
                 line=line[1:].lstrip()
@@ -165,12 +238,18 @@ class WikiTable:
                 cellColspan
             )
 
+            # Where spans overlap, the first one added wins
             if cellRowspan != 1:
-                rowspans.append(cell)
+                for sy in range(y + 1, y + cellRowspan):
+                    setCovered = covered.setdefault(sy, {}).setdefault
+                    for sx in range(x, x + cellColspan):
+                        setCovered(sx, cellColspan)
             curRow.append(cell)
 
             x += cellColspan
         # last row edgecase
+        if contParts:
+            curRow[-1].content = "\n".join((curRow[-1].content, *contParts))
         rows.append(curRow)
 
 
@@ -191,9 +270,10 @@ class WikiTable:
         Gives you the shape of the table. 
 
         """
+        # Drawn with ascii placeholders into a bytearray per line,
+        # then swapped for the box drawing chars once at the end
         lines =  [
-            
-            [' ' for _ in range((self.width + 10) * colWidth) ]
+            bytearray(b' ' * ((self.width + 10) * colWidth))
             for _ in range((self.height + 1) * rowHeight)
         ]
         
@@ -204,25 +284,27 @@ class WikiTable:
                 mx = ox + cell.colspan * colWidth
                 my = oy + cell.rowspan * rowHeight
                 
-                for x in range(ox+1, mx):
-                    lines[oy][x] = lines[my][x] = '─'
+                # Whole horizontal edges are written with one slice store each
+                edge = b'-' * max(0, mx - ox - 1)
+                lines[oy][ox+1:mx] = edge
+                lines[my][ox+1:mx] = edge
                 for y in range(oy + 1, my):
-                    lines[y][ox] = lines[y][mx] = '│'
-        print(*("".join(line) for line in lines), sep="\n")
+                    lines[y][ox] = lines[y][mx] = ord('|')
+        print(b"\n".join(lines).decode().replace('-', '─').replace('|', '│'))
     def subtable(self, x, y, width=-1, height=-1):
         width = width if width != -1 else self.width + 1
         height = height if height != -1 else self.height + 1
         
 
+        # Every cell in a row shares the same y, so rows outside the
+        # range can be skipped without looking at their cells
         rows = [
             [WikitableCell(
                 cell.content, cell.isHeader, 
                 cell.x - x, cell.y - y,
                 cell.rowspan, cell.colspan)
-                for cell in row if (
-                    cell.x >= x and cell.y >= y and
-                    cell.x < x + width and cell.y < y + height
-            )]
+                for cell in row if x <= cell.x < x + width
+            ] if row and y <= row[0].y < y + height else []
             for row in self.rows
         ]
 
@@ -232,19 +314,26 @@ class WikiTable:
                 real_width = max(real_width, cell.x + cell.colspan)
         return WikiTable(rows, real_width, len(rows))
         
+    def scoped_rows(self, x0 : int, y0 : int, x1 : int, y1 : int) -> Iterator[List[WikitableCell]]:
+        """
+        Yield every row, keeping only the cells whose top left corner is within [x0, x1) and [y0, y1).
+        This sees the same cells as the rows of subtable(), but without copying them, so the
+        coordinates stay those of this table.
+        """
+        for row in self.rows:
+            if row and y0 <= row[0].y < y1:
+                yield [cell for cell in row if x0 <= cell.x < x1]
+            else:
+                yield []
+
     def search_headers(self, predicate : Callable[[str], bool]) -> List[WikitableCell]:
-        # Headers can only exist on the first row
-        return [
-            cell for cell in self.rows[0]
-            if cell.isHeader and predicate(cell.content)
-        ]
+        return [cell for cell in self._headers if predicate(cell.content)]
         
 
 
 
     def get(self, x : int, y : int) -> None | WikitableCell:
-        l = [cell for cell in  self.rows[y] if cell.x == x]
-        return None if len(l) == 0 else l[0]
+        return self._index.get((x, y))
 
 
 
@@ -257,7 +346,7 @@ class ProtocolNode:
 class ProtocolStrType(ProtocolNode):
 
     def __init__(self, txt : str) -> None:
-        self.txt = txt
+        self.txt = sys.intern(txt) if len(txt) < MAX_INTERN_LEN else txt
     def debug_str(self) -> str:
         return self.txt
 
@@ -310,7 +399,7 @@ class Wiki:
     name : str
     components : List['Wiki | str']
     def __init__(self, name, components) -> None:
-        self.name = name
+        self.name = sys.intern(name) if len(name) < MAX_INTERN_LEN else name
         self.components = components
     def debug(self) -> str:
         return f"{self.name}[{',\n'.join( (("Content of len: " + str(len(component)) if type(component) is str else component.debug()) for component in self.components))}]".replace("\n", "\n\t")
@@ -318,9 +407,40 @@ class Wiki:
 
     @classmethod
     def From_oldid(cls, oldid : int) -> 'Wiki':
-        jso = requests.get(BASE_URL.format(oldid )).json()
-        wikiContent = jso["query"]["pages"]["290319"]["revisions"][0]["slots"]["main"]["*"]
-        
+        return cls.From_oldids([oldid])[oldid]
+
+    @classmethod
+    def From_oldids(cls, oldids : List[int]) -> Dict[int, 'Wiki']:
+        """
+        Fetch and parse many revisions, batching them into as few api calls as the wiki allows.
+
+        :return: A dict mapping each oldid to its parsed Wiki
+        """
+        ret = {}
+        missing = []
+        for oldid in oldids:
+            wiki = _load_parsed(oldid)
+            if wiki is None:
+                missing.append(oldid)
+            else:
+                ret[oldid] = wiki
+
+        batches = [missing[i:i + MAX_REVIDS_PER_QUERY] for i in range(0, len(missing), MAX_REVIDS_PER_QUERY)]
+
+        # Requests spend almost all their time waiting on the network,
+        # so overlap them rather than paying each round trip in turn
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_QUERIES) as ex:
+            results = list(ex.map(_fetch_revisions, batches))
+
+        for revisions in results:
+            for revision in revisions:
+                wiki = cls.From_wikitext(revision["slots"]["main"]["*"])
+                _store_parsed(revision["revid"], wiki)
+                ret[revision["revid"]] = wiki
+        return ret
+
+    @classmethod
+    def From_wikitext(cls, wikiContent : str) -> 'Wiki':
         # WARNING: This is a bad assumption
         segments = wikiContent.split("\n=")
         
@@ -332,15 +452,15 @@ class Wiki:
         stack = [(-1, Wiki("root", components))]
 
         for segment in segments:
-            # Another HORRIBLE asssumption
-            deph = segment.find(' ')
-            assert deph != -1
+            heading, _, content = segment.partition('\n')
+            content = content.strip()
 
-            contentStart = segment.find('\n')
-            content = '' if contentStart == -1 else segment[contentStart:].strip() 
+            # Another HORRIBLE asssumption
+            marker, sep, name = heading.partition(' ')
+            assert sep
+            deph = len(marker)
 
-            name = segment[deph:]
-            name = name.split('=')[0].strip()
+            name = name.partition('=')[0].strip()
 
 
             wiki = Wiki(name, [content])
@@ -356,6 +476,48 @@ class Wiki:
         return stack[0][1]
     
 
+def _parsed_path(oldid : int) -> str:
+    return os.path.join(PARSED_CACHE_DIR, f"v{PARSED_CACHE_VERSION}_{oldid}.pkl")
+
+# Wiki is stored as plain (name, components) tuples so the pickle never
+# names the class, which would be __main__.Wiki when run as a script
+def _wiki_to_tree(wiki : Wiki) -> tuple:
+    return (wiki.name, [c if type(c) is str else _wiki_to_tree(c) for c in wiki.components])
+
+def _tree_to_wiki(tree : tuple) -> Wiki:
+    name, components = tree
+    return Wiki(name, [c if type(c) is str else _tree_to_wiki(c) for c in components])
+
+def _load_parsed(oldid : int) -> Optional[Wiki]:
+    path = _parsed_path(oldid)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            return _tree_to_wiki(pickle.load(f))
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, TypeError, ValueError):
+        # A damaged or stale entry is just a miss, it gets refetched and rewritten
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return None
+
+def _store_parsed(oldid : int, wiki : Wiki) -> None:
+    os.makedirs(PARSED_CACHE_DIR, exist_ok=True)
+    path = _parsed_path(oldid)
+
+    # Write beside the real file then swap it in, so an interrupted run
+    # never leaves a truncated pickle behind
+    with open(path + ".tmp", "wb") as f:
+        pickle.dump(_wiki_to_tree(wiki), f, pickle.HIGHEST_PROTOCOL)
+    os.replace(path + ".tmp", path)
+
+
+# The bounds (x0, y0, x1, y1) of the cells visible to one level of TypeGenCtx._parse_scope
+Scope = Tuple[int, int, int, int]
+WHOLE_TABLE : Scope = (0, 0, sys.maxsize, sys.maxsize)
+
 class SymmetryError(Exception):
     pass
 
@@ -363,12 +525,27 @@ class TypeGenCtx:
     proto_version : int
     def __init__(self, proto_version : int):
         self.proto_version = proto_version
+
+        # The same few type strings repeat across every packet, so each
+        # is only parsed once. The nodes are never modified, so are shared
+        self._type_cache : Dict[str, ProtocolNode] = {}
     
     def parse_type_content(self, type_content : str) -> ProtocolNode:
+        node = self._type_cache.get(type_content)
+        if node is None:
+            node = self._type_cache[type_content] = self._parse_type_content(type_content)
+        return node
+
+    def _parse_type_content(self, type_content : str) -> ProtocolNode:
         # TODO: THIS
         return ProtocolStrType(type_content)
 
-    def parse_subtable(self, name_col : WikiTable, type_col : WikiTable, forceEnumStyleAfter : int | None = None) -> ProtocolList:
+    def parse_subtable(self, name_col : WikiTable, type_col : WikiTable, forceEnumStyleAfter : int | None = None,
+                       name_scope : Scope = WHOLE_TABLE, type_scope : Scope = WHOLE_TABLE) -> ProtocolList:
+        """
+        The scopes allow the columns to be read straight out of a larger table, 
+        which sees the same cells as passing a subtable() of each.
+        """
         # Generally a, a type is symmetric across the table, with violation of this
         # rule either being an indication of a special condition, or a formatting
         # error on the part of the wiki editors. 
@@ -376,54 +553,70 @@ class TypeGenCtx:
         # Only check height, as width can change with Enums
         if name_col.height != type_col.height: raise SymmetryError()
 
+        return self._parse_scope(name_col, name_scope, type_col, type_scope, forceEnumStyleAfter)
+
+    def _parse_scope(self, name_col : WikiTable, name_scope : Scope, type_col : WikiTable, type_scope : Scope, forceEnumStyleAfter : int | None = None) -> ProtocolList:
+        """
+        Does the work of parse_subtable. Rather than building a new subtable for every nested type,
+        each level only narrows the scope (x0, y0, x1, y1) it reads out of the same two columns.
+        """
         fields = []
 
-        row_itr = zip(name_col.rows, type_col.rows)
-        for name_row, type_row in row_itr:
+        nx0, ny0, nx1, ny1 = name_scope
+        tx0, _, tx1, _ = type_scope
+
+        # Rows are consumed by moving i, which simply runs off the end
+        # once the scope is exhausted
+        rows = list(zip(name_col.scoped_rows(*name_scope), type_col.scoped_rows(*type_scope)))
+        i = 0
+        while i < len(rows):
+            name_row, type_row = rows[i]
+            i += 1
             if len(name_row) != len(type_row):
                 # When this happens typically there is a formatting
                 # issue on the Wiki itself, exept in the 'no fields' condition
                 if len(name_row) and name_row[0].content.strip() == "''no fields''":
                     # Now consume N rows
-                    for _ in range(name_row[0].rowspan - 1):
-                        try: next(row_itr)
-                        except StopIteration: break
-
+                    i += max(0, name_row[0].rowspan - 1)
                     continue
 
                 # The only time a mid-content header is seen _should_ be enums with conditional content.
                 # However some exceptional packets lack this header
                 elif len(name_row) > 1 and (
                         name_row[0].isHeader or (
-                            forceEnumStyleAfter is not None and forceEnumStyleAfter == name_row[0].y
+                            forceEnumStyleAfter is not None and forceEnumStyleAfter == name_row[0].y - ny0
                             )):
                     enumContents = []
                     while True:
-                        try:
-                            name_row, type_row = next(row_itr) if forceEnumStyleAfter is None else (name_row, type_row)
-                            # Evil hack
-                            forceEnumStyleAfter = None
-
-                            assert len(name_row) == 2, "We do not support an enum conditional field that is not at an end of a list, or has multiple layers (TODO)"
-                            enumContents.append(ProtocolConditionalOption(
-                                int(name_row[0].content.split(":")[0]),
-                                ProtocolAnnotation(
-
-                                        
-                                    self.parse_subtable(
-                                        name_col.subtable(name_row[1].x, name_row[1].y, height=name_row[0].rowspan),
-                                        type_col.subtable(type_row[0].x, name_row[1].y, height=name_row[0].rowspan)
-                                    ) if len(type_row) and name_row[1] != "''no fields''"
-                                      else ProtocolList([]),
-                                    name_row[0].content,
-                                )
-                            ))
-                            for _ in range(name_row[0].rowspan - 1):
-                                next(row_itr)
-
-
-                        except StopIteration:
+                        if forceEnumStyleAfter is None:
+                            if i >= len(rows):
+                                break
+                            name_row, type_row = rows[i]
+                            i += 1
+                        # Evil hack
+                        forceEnumStyleAfter = None
+
+                        assert len(name_row) == 2, "We do not support an enum conditional field that is not at an end of a list, or has multiple layers (TODO)"
+                        y1 = min(ny1, name_row[1].y + name_row[0].rowspan)
+                        enumContents.append(ProtocolConditionalOption(
+                            int(name_row[0].content.partition(":")[0]),
+                            ProtocolAnnotation(
+
+                                    
+                                self._parse_scope(
+                                    name_col, (name_row[1].x, name_row[1].y, nx1, y1),
+                                    type_col, (type_row[0].x, name_row[1].y, tx1, y1)
+                                ) if len(type_row) and name_row[1] != "''no fields''"
+                                  else ProtocolList([]),
+                                name_row[0].content,
+                            )
+                        ))
+
+                        # The option's rows must all be there
+                        skip = name_row[0].rowspan - 1
+                        if skip > len(rows) - i:
                             break
+                        i += max(0, skip)
                     fields.append(("Actions", ProtocolConditional(enumContents)))
                     # Todo: Support enums that are not the end of a list
                     break
@@ -438,20 +631,20 @@ class TypeGenCtx:
             else:
                 # The first elements rowspan tells us how long the recusive type is
                 if name_row[0].rowspan != type_row[0].rowspan: raise SymmetryError()
+                y0 = name_row[0].y
+                y1 = min(ny1, y0 + name_row[0].rowspan)
                 fields.append((
                     name_row[0].content,
                     ProtocolTypeBinary(
                         self.parse_type_content(type_row[0].content),
-                        self.parse_subtable(
-                            name_col.subtable(name_row[0].colspan, name_row[0].y, height=name_row[0].rowspan),
-                            type_col.subtable(name_row[0].colspan, name_row[0].y, height=name_row[0].rowspan)
+                        self._parse_scope(
+                            name_col, (nx0 + name_row[0].colspan, y0, nx1, y1),
+                            type_col, (tx0 + name_row[0].colspan, y0, tx1, y1)
                         )
                     )
                 ))
                 # Now consume N rows
-                for _ in range(name_row[0].rowspan):
-                    try: next(row_itr)
-                    except StopIteration: break
+                i += max(0, name_row[0].rowspan)
         return ProtocolList(
            fields 
         )
@@ -542,6 +735,7 @@ def parse_modern_packet_id(id_col : str) -> Dict[str, str]:
 
     ret = {}
     txt = id_col
+    end = len(txt)
 
 
     # Fix for: Legacy Server List Ping
@@ -550,29 +744,34 @@ def parse_modern_packet_id(id_col : str) -> Dict[str, str]:
         return {"protocol": id_col}
 
 
-
-    while txt:
-        assert txt.startswith("''"), f"Packet id format error, see: {id_col}"
-        txt = txt[2:]
-        nameEnd = txt.find(":''")
+    # Walks an index through txt, only slicing out the names and values.
+    # As with slicing from find() + 1, a missing > leaves pos where it was
+    pos = 0
+    while pos < end:
+        assert txt.startswith("''", pos), f"Packet id format error, see: {id_col}"
+        pos += 2
+        nameEnd = txt.find(":''", pos)
 
         assert nameEnd != -1
 
-        name = txt[:nameEnd]
+        name = txt[pos:nameEnd]
         
         # Skip br
-        txt = txt[txt.find(">") +1: ]
+        pos = txt.find(">", pos) + 1 or pos
 
-        assert txt.startswith("<code>")
-        txt = txt[len("<code>"):]
-        value = txt[:txt.find("<")]
+        assert txt.startswith("<code>", pos)
+        pos += len("<code>")
+        valueEnd = txt.find("<", pos)
+        value = txt[pos:valueEnd if valueEnd != -1 else -1]
 
 
         # Skip to </code>
-        txt = txt[txt.find(">") +1: ]
-        while txt and txt.startswith("<br"):
-            # Skip brs
-            txt = txt[txt.find(">") +1: ]
+        pos = txt.find(">", pos) + 1 or pos
+        while txt.startswith("<br", pos):
+            # Skip brs, stopping at one that never ends
+            if (gt := txt.find(">", pos)) == -1:
+                break
+            pos = gt + 1
 
         ret[name] = value
     return ret
@@ -594,14 +793,15 @@ def modern_packet_parse(packet : Wiki, ctx : TypeGenCtx) -> Packet:
     preamble = ""
     
     # Create the preamble and seek txt to first table
-    while txt:
-        line, head = consume_line(txt)
-
+    lines = txt.split("\n")
+    for i, line in enumerate(lines):
         if line.startswith("{|"):
+            txt = "\n".join(lines[i:])
             break
 
-        txt = head
-        preamble += line + "\n"
+        preamble += line.rstrip() + "\n"
+    else:
+        txt = None
 
     if txt is None or not len(txt):
         raise Exception(f"Cannot find packet table for {packet.name}. Intervention required!")
@@ -645,11 +845,13 @@ def modern_packet_parse(packet : Wiki, ctx : TypeGenCtx) -> Packet:
     assert 1 == len(nameHeader)
     assert 1 == len(typeHeader)
 
-    nameCol = packetTable.subtable(nameHeader[0].x, 1, width=nameHeader[0].colspan)
-    typeCol = packetTable.subtable(typeHeader[0].x, 1, width=typeHeader[0].colspan)
+    # The field columns, from the row after the headers down
+    nameScope = (nameHeader[0].x, 1, nameHeader[0].x + nameHeader[0].colspan, sys.maxsize)
+    typeScope = (typeHeader[0].x, 1, typeHeader[0].x + typeHeader[0].colspan, sys.maxsize)
 
     try:
-        packetType = ctx.parse_subtable(nameCol, typeCol, forceEnumStyleAfter=patch.force_enum_after)
+        packetType = ctx.parse_subtable(packetTable, packetTable, forceEnumStyleAfter=patch.force_enum_after,
+                                        name_scope=nameScope, type_scope=typeScope)
     except SymmetryError as e: 
         print(f"Symmetry error in packet {packet.name}. Intervention required!")
         print(packet.components[0])
@@ -683,8 +885,9 @@ def modern_packet_parse(packet : Wiki, ctx : TypeGenCtx) -> Packet:
 
 
 
-MODERN_WIKI_WHITELIST = ["Status", "Login", "Handshaking", "Configuration", "Play"]        
-MODERN_WIKI_IGNORELIST = ["Definitions", "Packet format", "Navigation"]
+MODERN_WIKI_WHITELIST = frozenset({"Status", "Login", "Handshaking", "Configuration", "Play"})
+MODERN_WIKI_IGNORELIST = frozenset({"Definitions", "Packet format", "Navigation"})
+MODERN_WIKI_DESTINATIONS = frozenset({"Clientbound", "Serverbound"})
 def modern_wiki_parse(root : Wiki, proto_version : int):
     assert root.name == "root"
 
@@ -707,7 +910,7 @@ def modern_wiki_parse(root : Wiki, proto_version : int):
             if type(destination) is str:
                 continue
         
-            assert destination.name in ["Clientbound", "Serverbound"], f"Unknown destination {destination.name}"
+            assert destination.name in MODERN_WIKI_DESTINATIONS, f"Unknown destination {destination.name}"
 
             packet_wikis : List[Wiki] = [c for c in destination.components if type(c) is not str]
             